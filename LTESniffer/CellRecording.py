@@ -15,15 +15,15 @@
 #
 
 import os
-import logging
 import time
 import subprocess
 from pathlib import Path
-from typing import Tuple
+from typing import Optional, Tuple
 from datetime import datetime
 
 from .HackRF.Exceptions import HackRFError
 from .Structures.Cell import Cell
+from .Log import logging
 
 
 class CellRecording:
@@ -42,39 +42,53 @@ class CellRecording:
         self._enable = enable
         self.path_recording_dir = path_recording_dir
         self._lte_sniffer = lte_sniffer
+        self._file_name_suffix: Optional[str] = None
 
         os.makedirs(self.path_recording_dir, exist_ok=True)
 
+    def _get_file_name_suffix(self) -> str:
+        """
+        Get the part of the file name which only depends on the hackRF
+        settings.
+        :return: The suffix of the file name.
+        """
+        hackrf = self._lte_sniffer.hack_rf
+        return (
+            f"bw{int(hackrf.baseband_filter_bw)}_"
+            f"l{hackrf.l_gain}_g{hackrf.g_gain}_amp{int(hackrf.amp_enable)}_"
+            f"{int(hackrf.recording_time)}s.bin"
+        )
+
     def get_recording_path(self, cell: Cell) -> Tuple[Path, str]:
         """
         Get the path for the recording file of the given cell.
         :param cell: The LTE cell that should be recorded.
         :return: 2-Tuple: the full path, file name
         """
-        hackrf = self._lte_sniffer.hack_rf
+        # the hackRF settings do not change during a recording session
+        if self._file_name_suffix is None:
+            self._file_name_suffix = self._get_file_name_suffix()
         # hackrf_recording_{scan_id}f{frequency}_bw{bw}_l{}_g{}_amp{}_cell{}
         # .bin
         file_name = (
             f"{datetime.now().strftime('%y%m%d_%H%M')}_"
             f"hackrf_recording_{cell.scan_id}_cell{cell.cell_id}_"
-            f"f{cell.frequency_center}_"
-            f"bw{int(hackrf.baseband_filter_bw)}_"
-            f"l{hackrf.l_gain}_g{hackrf.g_gain}_amp{int(hackrf.amp_enable)}_"
-            f"{int(hackrf.recording_time)}s.bin"
+            f"f{cell.frequency_center}_{self._file_name_suffix}"
         )
 
         return self.path_recording_dir / file_name, file_name
 
-    def record_cell(self, cell: Cell):
+    async def record_cell(self, cell: Cell):
         path, file_name = self.get_recording_path(cell)
         cur_try = 1
         while True:
             try:
-                self._lte_sniffer.hack_rf.cell_recording(
+                await self._lte_sniffer.hack_rf.cell_recording(
                     frequency_center=cell.frequency_center,
                     path=path
                 )
                 cell.recordings.append(file_name)
+                self._lte_sniffer.cell_search.mark_dirty()
             except HackRFError as e:
                 logging.critical(e)
             except subprocess.CalledProcessError:
@@ -82,6 +96,7 @@ class CellRecording:
                     logging.error(
                         f"Recording of cell {cell} failed! Try "
                         f"{cur_try}/{5}.")
+                    cur_try += 1
                     continue
                 else:
                     logging.critical(f"Recording of cell {cell} "
@@ -90,6 +105,13 @@ class CellRecording:
             logging.debug(f"Finished recording of cell {cell}.")
             break
 
+    async def _record_cells(self):
+        """
+        Record all cells one after another.
+        """
+        for cell in self._lte_sniffer.cell_search.all_cells:
+            await self.record_cell(cell)
+
     def record(self):
         """
         Record data from all stored cells.
@@ -98,14 +120,16 @@ class CellRecording:
             return
 
         logging.debug("Starting Recording:")
+        self._file_name_suffix = self._get_file_name_suffix()
         time.sleep(2)  # cooldown
 
         try:
-            for band in self._lte_sniffer.cell_search.frequency_bands:
-                for cell in band.cells:
-                    self.record_cell(cell)
+            # same event loop as the scans (closed in CellSearch.close())
+            self._lte_sniffer.cell_search.run_until_complete(
+                self._record_cells())
         except KeyboardInterrupt as e:
             raise e
         finally:
-            self._lte_sniffer.cell_search.save_results_to_json()
-            self._lte_sniffer.cell_search.save_results_to_csv()
+            # only writes the files if a recording has been added
+            # (in the io thread - waited for in CellSearch.close())
+            self._lte_sniffer.cell_search.save_results_in_background()
@@ -15,20 +15,47 @@
 #
 
 import asyncio
-import copy
-import logging
+import contextlib
 import os
 import csv
-import simplejson as json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Optional
+from operator import itemgetter
+from typing import List, Dict, Optional, Iterable, Iterator, Tuple
 
+from . import FastJSON
 from .HackRF.HackRF import HackRF
 from .HackRF.Exceptions import HackRFError, ScanTimeOut
 from .ProviderMapping import ProviderMapping
 from .Structures.Cell import Cell
 from .Structures.FrequencyBand import FrequencyBand
+from .Log import logging
+
+# Columns of the results csv file
+CSV_FIELDNAMES = ("cell_id", "scan_id", "time", "dpx", "antenna_port",
+                  "frequency_center", "frequency_offset", "rx_power",
+                  "cp_type", "nRB", "PHICH_duration", "PHICH_resource_type",
+                  "crystal_correction_factor", "operator_id", "operator",
+                  "band", "region")
+
+# Extracts the csv columns stored in the log entries of a cell
+_get_csv_log_fields = itemgetter(
+    "antenna_port", "frequency_center", "frequency_offset", "rx_power",
+    "cp_type", "nRB", "PHICH_duration", "PHICH_resource_type",
+    "crystal_correction_factor"
+)
+
+
+def _log_save_error(future: Future):
+    """
+    Log the exception of a failed background save.
+    :param future: The finished save operation.
+    """
+    if not future.cancelled() and future.exception() is not None:
+        logging.error("Failed to save the results! Exception: %s",
+                      future.exception())
 
 
 class CellSearch:
@@ -61,9 +88,22 @@ class CellSearch:
         self._path_results_csv = path_results_dir / "CellSearchResults.csv"
 
         self.frequency_bands: List[FrequencyBand] = []
+        # all cells of all bands (in the order they have been added)
+        self._all_cells: List[Cell] = []
 
         self._provider_mapping = provider_mapping
 
+        # True if the results changed since they have been saved
+        self._dirty = False
+        # saves can run in the io thread (see save_results_in_background)
+        self._save_lock = threading.Lock()
+        self._io_pool = ThreadPoolExecutor(max_workers=1)
+
+        # one event loop for all scans
+        self._loop = asyncio.new_event_loop()
+        # serializes the access to the hackRF (see _perform_search_async)
+        self._hackrf_lock: Optional[asyncio.Lock] = None
+
         # Load config and restore data
         self.load_frequency_bands()
         self.load_results()
@@ -76,8 +116,8 @@ class CellSearch:
         """
         # read file
         try:
-            with open(self._path_scan_config, "r") as fp:
-                data = json.load(fp)
+            with open(self._path_scan_config, "rb") as fp:
+                data = FastJSON.loads(fp.read())
         except OSError as e:
             logging.exception("Failed to load bands config: %s! Exception: %s",
                               self._path_scan_config, e)
@@ -107,8 +147,8 @@ class CellSearch:
         for band in self.frequency_bands:
             data.append(band.dict())
         try:
-            with open(self._path_scan_config, "w") as fp:
-                json.dump(data, fp, indent=2)
+            with open(self._path_scan_config, "wb") as fp:
+                fp.write(FastJSON.dumps(data, indent=True))
         except OSError as e:
             logging.exception("Failed to save bands config: %s! Exception: %s",
                               self._path_scan_config, e)
@@ -117,42 +157,104 @@ class CellSearch:
         logging.debug("Successfully saved updated bands config to %s",
                       self._path_scan_config)
 
-    def _scan_peak(self, band: FrequencyBand, window_start, window_end):
-        count = 0
-        while True:
-            # Scan the whole area (EG: Peak at 816MHz ->
-            # 815.1 - 816.9 MHz. (Because the gross scan already
-            # scanned the others)).
-            window_start -= (self.step_width - 1) * 100e3
-            window_end += (self.step_width - 1) * 100e3
-            logging.debug(f"Scanning peak! - Area {window_start / 1e6}"
-                          f"MHz - {window_end / 1e6}MHz")
+    @property
+    def all_cells(self) -> List[Cell]:
+        """
+        All cells of all bands in the order they have been added.
+        """
+        return self._all_cells
+
+    def _add_cell(self, band: FrequencyBand, cell: Cell):
+        """
+        Add a cell to the given band.
+        :param band: The band of the cell.
+        :param cell: The new cell.
+        """
+        band.add_cell(cell)
+        self._all_cells.append(cell)
+
+    async def _cell_search(self, **kwargs):
+        """
+        Run HackRF.cell_search while holding the hackRF lock.
+        Only one scan can use the hackRF at a time.
+
+        :param kwargs: Arguments for HackRF.cell_search.
+        :return: The result of HackRF.cell_search.
+        """
+        # created on first use to bind it to the running loop
+        if self._hackrf_lock is None:
+            self._hackrf_lock = asyncio.Lock()
+        async with self._hackrf_lock:
+            return await HackRF.cell_search(**kwargs)
+
+    async def _retry_cell_search(self, label: str, max_attempts: int = 4,
+                                 **kwargs) -> Optional[Tuple[Dict, List]]:
+        """
+        Run a cell search and try again if it times out.
+        Waits 0.1s, 0.2s, 0.4s, ... (max 2s) before the next attempt.
+
+        :param label: Description of the scan for the logs.
+        :param max_attempts: Max number of attempts.
+        :param kwargs: Arguments for HackRF.cell_search.
+
+        :return: The result of HackRF.cell_search or None if the scan failed.
+        """
+        for attempt in range(max_attempts):
             try:
-                loop = asyncio.get_event_loop()
-                peaks_new, cells_dict = loop.run_until_complete(
-                    HackRF.cell_search(
-                        start_frequency=window_start,
-                        end_frequency=window_end,
-                        step_width=1
-                    )
-                )
-                self._process_search_result(band, window_start,
-                                            window_end, cells_dict)
-                return True
+                return await self._cell_search(**kwargs)
             except ScanTimeOut:
-                msg = "Peak scan timed out!"
-                if count < 3:
-                    count += 1
-                    logging.error(msg + "Tying again!")
-                    continue
-                return False
+                if attempt + 1 >= max_attempts:
+                    logging.error("%s timed out!", label)
+                    break
+                logging.error("%s timed out! Tying again!", label)
+                await asyncio.sleep(min(2 ** attempt * 0.1, 2.0))
             except HackRFError as e:
-                logging.exception(
-                    f"{band}: Peak Scan {window_start / 1e6}MHz - "
-                    f"{window_end / 1e6}MHz failed! {e}")
-                return False
+                logging.exception("%s failed! %s", label, e)
+                break
+        return None
+
+    async def _scan_peak(self, band: FrequencyBand, window_start, window_end):
+        # Scan the whole area (EG: Peak at 816MHz ->
+        # 815.1 - 816.9 MHz. (Because the gross scan already
+        # scanned the others)).
+        window_start -= (self.step_width - 1) * 100e3
+        window_end += (self.step_width - 1) * 100e3
+        logging.debug("Scanning peak! - Area %sMHz - %sMHz",
+                      window_start / 1e6, window_end / 1e6)
+        result = await self._retry_cell_search(
+            f"{band}: Peak scan {window_start / 1e6}MHz - "
+            f"{window_end / 1e6}MHz",
+            start_frequency=window_start,
+            end_frequency=window_end,
+            step_width=1
+        )
+        if result is None:
+            return False
+        peaks_new, cells_dict = result
+        self._process_search_result(band, window_start, window_end,
+                                    cells_dict)
+        return True
+
+    @staticmethod
+    def _group_peaks(peaks: Iterable[int],
+                     max_gap: float) -> List[Tuple[int, int]]:
+        """
+        Group neighbouring peaks into scan windows.
+
+        :param peaks: Peak frequencies in Hz.
+        :param max_gap: Max distance between two peaks of the same window.
+
+        :returns: List of windows (2-Tuple: first peak, last peak)
+        """
+        windows = []
+        for peak in sorted(peaks):
+            if windows and peak - windows[-1][1] <= max_gap:
+                windows[-1][1] = peak
+            else:
+                windows.append([peak, peak])
+        return [(start, end) for start, end in windows]
 
-    def _scan_peaks(self, band: FrequencyBand, peaks: Dict):
+    async def _scan_peaks(self, band: FrequencyBand, peaks: Dict):
         """
         Go through all found peaks and scan with a step width of 100kHz
         to find 4G cells.
@@ -163,36 +265,12 @@ class CellSearch:
         :returns: True if all peak scans have been completed successfully
             else False.
         """
-        # Init
-        last_peak = window_start = window_end = 0
         peak_scan_successful = True
-        run_peak_scan = False
-        for i, peak in enumerate(peaks):
-            # Init the variables (1st peak)
-            if last_peak == 0 or run_peak_scan:
-                window_start = peak
-                window_end = peak
-            if last_peak == 0:
-                last_peak = peak
-
-            run_peak_scan = False
-
-            # Run a peak scan if the distance between the last peak and current
-            # peak is > peak width = new (area)
-            if (peak - last_peak) > self.step_width * 100e3:
-                run_peak_scan = True
-                window_end = last_peak
-
-            # Trigger a scan if we reach the end of the scan window
-            if len(peaks) - 1 == i:
-                run_peak_scan = True
-                window_end = peak
-
-            # Run the scan if requested
-            if run_peak_scan:
-                peak_scan_successful = self._scan_peak(band, window_start,
-                                                       window_end)
-            last_peak = peak
+        # Peaks closer than the step width of the gross scan share a window
+        for window_start, window_end in self._group_peaks(
+                peaks, self.step_width * 100e3):
+            if not await self._scan_peak(band, window_start, window_end):
+                peak_scan_successful = False
         return peak_scan_successful
 
     def _process_search_result(self, band: FrequencyBand, start: int, end: int,
@@ -208,34 +286,32 @@ class CellSearch:
         """
         # cells found?
         if len(cells_dict) > 0:
-            logging.info(
-                f"{band} (Scan: Start: {start / 1e6} MHz, "
-                f"End: {end / 1e6} MHz): {len(cells_dict)} cells found!")
+            logging.info("%s (Scan: Start: %s MHz, End: %s MHz): %s cells "
+                         "found!", band, start / 1e6, end / 1e6,
+                         len(cells_dict))
         else:
-            logging.info(
-                f"{band} (Scan: Start: {start / 1e6} MHz, End: {end / 1e6} MHz"
-                f"): No cells found!")
+            logging.info("%s (Scan: Start: %s MHz, End: %s MHz): No cells "
+                         "found!", band, start / 1e6, end / 1e6)
+
+        # last time we have seen the cells. (actually not accurate)
+        # all cells of this result share the same timestamp
+        last_seen = datetime.now().strftime("%x %X")
 
         # parse the cell data to Cell objects
         for cell_dict in cells_dict:
             # log_dict: (current timestamp)
-            log_dict: Dict = copy.deepcopy(cell_dict)
-            del log_dict["cell_id"]  # remove the id from the log_dict
+            # (cell_dict is flat - no deepcopy needed. Remove the id.)
+            log_dict: Dict = {key: value for key, value in cell_dict.items()
+                              if key != "cell_id"}
 
-            # last time we have seen the cell. (actually not accurate)
-            last_seen = datetime.now().strftime("%x %X")
             cell_dict["last_seen"] = last_seen
 
             # does the cell already exist?
-            cell = None
-            cell_id = cell_dict["cell_id"]
-            for cur_cell in band.cells:
-                if cur_cell.cell_id == cell_id:
-                    cell = cur_cell
-                    logging.info(f"Found existing cell {cell}")
-                    # update the log dict of the existing cell
-                    cell.data["log"][last_seen] = log_dict
-                    break
+            cell = band.get_cell(cell_dict["cell_id"])
+            if cell:
+                logging.info("Found existing cell %s", cell)
+                # update the log dict of the existing cell
+                cell.data["log"][last_seen] = log_dict
 
             # new cell
             if not cell:
@@ -251,35 +327,23 @@ class CellSearch:
                 cell.data["log"] = {
                     last_seen: log_dict
                 }
-                band.cells.append(cell)
-                logging.info(f"Found new cell {cell}")
+                self._add_cell(band, cell)
+                logging.info("Found new cell %s", cell)
+        self._dirty = True
         logging.debug("Finished cell search routine")
 
-    def _gross_scan_band(self, band: FrequencyBand):
-        count = 0
-        while True:
-            try:
-                # Search for peaks width the defined step width
-                loop = asyncio.get_event_loop()
-                peaks, cells_dict = loop.run_until_complete(
-                    HackRF.cell_search(
-                        start_frequency=band.start_frequency,
-                        end_frequency=band.end_frequency,
-                        step_width=self.step_width
-                    )
-                )
-                return True, peaks
-            except ScanTimeOut:
-                msg = f"The gross scan for {band} timed out! "
-                if count < 3:
-                    count += 1
-                    logging.error(msg + "Tying again!")
-                    continue
-                break
-            except HackRFError as e:
-                logging.exception(f"{band}: Scan failed! {e}")
-                break
-        return False, {}
+    async def _gross_scan_band(self, band: FrequencyBand):
+        # Search for peaks width the defined step width
+        result = await self._retry_cell_search(
+            f"The gross scan for {band}",
+            start_frequency=band.start_frequency,
+            end_frequency=band.end_frequency,
+            step_width=self.step_width
+        )
+        if result is None:
+            return False, {}
+        peaks, cells_dict = result
+        return True, peaks
 
     def perform_search(self):
         """
@@ -294,64 +358,95 @@ class CellSearch:
         if len(self.frequency_bands) == 0:
             logging.warning("There are not defined any bands?")
 
-        # issue a scan for all bands
+        # collect the bands which have to be scanned
+        bands = []
         for band in self.frequency_bands:
             # Scan disabled for band?
             if band.scan is False:
-                logging.debug(f"Ignoring band {band}: Scan is set to False!")
+                logging.debug("Ignoring band %s: Scan is set to False!", band)
                 continue
 
             # Already scanned and rescan disabled?
             if self.scan_id in band.scanned_ids and not self._rescan:
-                logging.debug(f"Ignoring band {band}: Already scanned!")
+                logging.debug("Ignoring band %s: Already scanned!", band)
                 continue
+            bands.append(band)
 
-            # Run the scan
-            logging.debug(
-                f"{band}: Starting a gross scan for peaks. Width "
-                f"{self.step_width * 100}kHz")
+        self._loop.run_until_complete(self._perform_search_async(bands))
 
-            gross_scan_successful, peaks = self._gross_scan_band(band)
-            if not gross_scan_successful:
-                continue
+    async def _gross_scan_bands(self, bands: List[FrequencyBand],
+                                queue: asyncio.Queue):
+        """
+        Producer: Run the gross scans of the given bands and pass the peaks
+        of every successfully scanned band to the queue.
+        None signals the end of the scans.
+
+        :param bands: The bands to scan.
+        :param queue: Queue for the peak scans.
+        """
+        try:
+            for band in bands:
+                logging.debug("%s: Starting a gross scan for peaks. Width "
+                              "%skHz", band, self.step_width * 100)
+
+                gross_scan_successful, peaks = await self._gross_scan_band(
+                    band)
+                if gross_scan_successful:
+                    await queue.put((band, peaks))
+        except Exception:
+            # do not let the consumer wait forever
+            await queue.put(None)
+            raise
+        await queue.put(None)
+
+    async def _perform_search_async(self, bands: List[FrequencyBand]):
+        """
+        Scan the given bands. The gross scan of the next band is started
+        while the peaks of the current band are processed. The hackRF itself
+        is only used by one scan at a time.
+
+        :param bands: The bands to scan.
+        """
+        queue = asyncio.Queue(maxsize=1)
+        producer = asyncio.ensure_future(self._gross_scan_bands(bands, queue))
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                band, peaks = item
 
-            # Perform a peak scan width a more accurate resolution
-            peak_scan_successful = self._scan_peaks(band, peaks)
+                # Perform a peak scan width a more accurate resolution
+                peak_scan_successful = await self._scan_peaks(band, peaks)
 
-            # add the scan id to the scan config to signal a successful scan
-            if(peak_scan_successful
-                    and gross_scan_successful
-                    and self.scan_id not in band.scanned_ids):
-                band.scanned_ids.append(self.scan_id)
+                # add the scan id to the scan config to signal a successful
+                # scan
+                if (peak_scan_successful
+                        and self.scan_id not in band.scanned_ids):
+                    band.scanned_ids.append(self.scan_id)
+            await producer
+        finally:
+            if not producer.done():
+                producer.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await producer
 
     def fast_search_cell(self, band: FrequencyBand, cell: Cell):
         start_frequency = int(cell.frequency_center - 200e3)
         end_frequency = int(cell.frequency_center + 200e3)
-        count = 0
-        while True:
-            try:
-                # Search for peaks width the defined step width
-                loop = asyncio.get_event_loop()
-                peaks, cells_dict = loop.run_until_complete(
-                    HackRF.cell_search(
-                        start_frequency=start_frequency,
-                        end_frequency=end_frequency
-                    )
-                )
-                self._process_search_result(band, start_frequency,
-                                            end_frequency, cells_dict)
-                return True
-            except ScanTimeOut:
-                msg = f"Scan for cell {cell} timed out!"
-                if count < 3:
-                    count += 1
-                    logging.error(msg + "Tying again!")
-                    continue
-                break
-            except HackRFError as e:
-                logging.exception(f"{cell}: Scan failed! {e}")
-                break
-        return False
+        result = self._loop.run_until_complete(
+            self._retry_cell_search(
+                f"Scan for cell {cell}",
+                start_frequency=start_frequency,
+                end_frequency=end_frequency
+            )
+        )
+        if result is None:
+            return False
+        peaks, cells_dict = result
+        self._process_search_result(band, start_frequency, end_frequency,
+                                    cells_dict)
+        return True
 
     def perform_fast_search(self):
         """
@@ -363,100 +458,110 @@ class CellSearch:
             return
         logging.debug("Starting Fast Cell Search Routine")
 
-        scanned_frequencies = []
+        scanned_frequencies = set()
         for band in self.frequency_bands:
             if band.scan is False or self.scan_id not in band.scanned_ids:
                 continue
 
             for cell in band.cells:
                 if cell.frequency_center in scanned_frequencies:
-                    logging.debug(f"{band}: Skipping {cell}! Already scanned"
-                                  " frequency.")
+                    logging.debug("%s: Skipping %s! Already scanned "
+                                  "frequency.", band, cell)
                     continue
-                logging.debug(
-                    f"{band}: Refreshing cell data for {cell}.")
+                logging.debug("%s: Refreshing cell data for %s.", band, cell)
 
                 if self.fast_search_cell(band, cell):
-                    scanned_frequencies.append(cell.frequency_center)
+                    scanned_frequencies.add(cell.frequency_center)
 
     def perform_provider_mapping(self):
         """
 
         :return:
         """
-        for band in self.frequency_bands:
-            for cell in band.cells:
-                self._provider_mapping.find_provider(cell)
+        self._provider_mapping.find_providers(self._all_cells)
+        self._dirty = True
+
+    def mark_dirty(self):
+        """
+        Signal that the results changed and have to be saved again.
+        """
+        self._dirty = True
+
+    def save_results(self, force: bool = False):
+        """
+        Save the scan results to the json and csv file if they changed since
+        the last save.
+
+        :param force: Save even if nothing changed.
+        """
+        with self._save_lock:
+            if not self._dirty and not force:
+                logging.debug("Results unchanged. Skipping save.")
+                return
+            self.save_results_to_json()
+            self.save_results_to_csv()
+            self._dirty = False
+
+    def save_results_in_background(self) -> Future:
+        """
+        Run save_results in the io thread. The caller must not modify the
+        results until the returned future is done.
+        close() waits for all pending saves.
+
+        :return: Future of the save operation.
+        """
+        future = self._io_pool.submit(self.save_results)
+        future.add_done_callback(_log_save_error)
+        return future
 
     def save_results_to_json(self):
         """
         Save the scan results in a json file.
         """
         # generate the data for the json file
-        results = []
-        for band in self.frequency_bands:
-            band_dict = band.dict()
-            band_dict["cells"] = {}
-            for cell in band.cells:
-                band_dict["cells"][cell.cell_id] = cell.dict()
-            results.append(band_dict)
+        results = [
+            {**band.dict(),
+             "cells": {cell.cell_id: cell.dict() for cell in band.cells}}
+            for band in self.frequency_bands
+        ]
 
         # create the needed folders
         os.makedirs(self._path_results_dir, exist_ok=True)
 
         # write the json
-        with open(self._path_results_json, "w") as fp:
-            json.dump(results, fp, indent=2)
+        with open(self._path_results_json, "wb") as fp:
+            # machine readable - no indentation
+            fp.write(FastJSON.dumps(results))
         logging.debug("Successfully saved results to %s",
                       self._path_results_json)
 
+    def _iter_csv_rows(self) -> Iterator[Tuple]:
+        """
+        Generate the rows of the csv file. (One row per log entry)
+        The order of the values matches CSV_FIELDNAMES.
+        :return: Iterator over the rows.
+        """
+        for cell in self._all_cells:
+            for time, log in cell.data["log"].items():
+                yield (cell.cell_id, cell.scan_id, time, cell.dpx,
+                       *_get_csv_log_fields(log),
+                       cell.operator_id, cell.operator, cell.band,
+                       cell.region)
+
     def save_results_to_csv(self):
         """
         Save the scan results in a csv file.
         """
-        # generate the data for the csv file
-        results = []
-        for band in self.frequency_bands:
-            for cell in band.cells:
-                for time, log in cell.data["log"].items():
-                    tmp_dict = {
-                        "cell_id": cell.cell_id,
-                        "scan_id": cell.scan_id,
-                        "time": time,
-                        "dpx": cell.dpx,
-                        "antenna_port": log["antenna_port"],
-                        "frequency_center": log["frequency_center"],
-                        "frequency_offset": log["frequency_offset"],
-                        "rx_power": log["rx_power"],
-                        "cp_type": log["cp_type"],
-                        "nRB": log["nRB"],
-                        "PHICH_duration": log["PHICH_duration"],
-                        "PHICH_resource_type": log["PHICH_resource_type"],
-                        "crystal_correction_factor":
-                            log["crystal_correction_factor"],
-                        "operator_id": cell.operator_id,
-                        "operator": cell.operator,
-                        "band": cell.band,
-                        "region": cell.region
-                    }
-                    results.append(tmp_dict)
         # create the needed folders
         os.makedirs(self._path_results_dir, exist_ok=True)
 
         # write the csv
-        with open(self._path_results_csv, "w") as f:
+        with open(self._path_results_csv, "w", newline="",
+                  buffering=1 << 20) as f:
 
-            fieldnames = ["cell_id", "scan_id", "time", "dpx", "antenna_port",
-                          "frequency_center", "frequency_offset", "rx_power",
-                          "cp_type", "nRB", "PHICH_duration",
-                          "PHICH_resource_type", "crystal_correction_factor",
-                          "operator_id", "operator", "band", "region"]
-
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-
-            writer.writeheader()
-            for result in results:
-                writer.writerow(result)
+            writer = csv.writer(f)
+            writer.writerow(CSV_FIELDNAMES)
+            writer.writerows(self._iter_csv_rows())
         logging.debug("Successfully saved results to %s",
                       self._path_results_csv)
 
@@ -465,28 +570,36 @@ class CellSearch:
         Load existing scan data and populate the object structure.
         """
         try:
-            with open(self._path_results_json, "r") as fp:
-                results = json.load(fp)
+            with open(self._path_results_json, "rb") as fp:
+                results = FastJSON.loads(fp.read())
         except FileNotFoundError:
             logging.info("Unable to load search scan results! Starting with a"
                          " clear record!")
             return
 
+        # bands by their (start, end) - saved results normally match exactly
+        bands_by_range: Dict[Tuple[int, int], FrequencyBand] = {}
+        for cur_band in self.frequency_bands:
+            bands_by_range.setdefault(
+                (cur_band.start_frequency, cur_band.end_frequency), cur_band)
+
         # parse the json
         for band_dict in results:
             # find the band
-            band: Optional[FrequencyBand] = None
-            for cur_band in self.frequency_bands:
-                if (band_dict["start"] >= cur_band.start_frequency
-                        and band_dict["end"] <= cur_band.end_frequency):
-                    band = cur_band
-                    break
+            band: Optional[FrequencyBand] = bands_by_range.get(
+                (band_dict["start"], band_dict["end"]))
+            if band is None:
+                # fall back to the first band containing the saved band
+                for cur_band in self.frequency_bands:
+                    if (band_dict["start"] >= cur_band.start_frequency
+                            and band_dict["end"] <= cur_band.end_frequency):
+                        band = cur_band
+                        break
             if band is None:
                 logging.critical(
-                    f"Invalid Scan Results: Band with start "
-                    f" {band_dict['start'] / 1e6} MHz and end "
-                    f"{band_dict['end'] / 1e6} MHz missing! "
-                    f"Path: {self._path_results_json}")
+                    "Invalid Scan Results: Band with start %s MHz and end %s "
+                    "MHz missing! Path: %s", band_dict["start"] / 1e6,
+                    band_dict["end"] / 1e6, self._path_results_json)
                 continue
 
             # process all cells of the band
@@ -504,7 +617,7 @@ class CellSearch:
                 cell.operator = cell_dict["operator"]
                 cell.operator = cell_dict["band"]
                 cell.region = cell_dict["region"]
-                band.cells.append(cell)
+                self._add_cell(band, cell)
         logging.info("Successfully restored previous scan results!")
 
     def search(self, fast=False):
@@ -523,5 +636,29 @@ class CellSearch:
             raise e
         finally:
             self.save_frequency_bands()
-            self.save_results_to_json()
-            self.save_results_to_csv()
+            self.save_results()
+
+    def run_until_complete(self, coro):
+        """
+        Run the given coroutine on the event loop of the scans. Tasks left
+        behind by an interruption are cancelled in close().
+        :param coro: the coroutine.
+        :return: the result of the coroutine.
+        """
+        return self._loop.run_until_complete(coro)
+
+    def close(self):
+        """
+        Wait for pending saves and close the event loop used for the scans.
+        """
+        self._io_pool.shutdown(wait=True)
+        if self._loop.is_closed():
+            return
+        # cancel scans left behind by an interrupted search
+        pending = asyncio.all_tasks(self._loop)
+        for task in pending:
+            task.cancel()
+        if pending:
+            self._loop.run_until_complete(
+                asyncio.gather(*pending, return_exceptions=True))
+        self._loop.close()
@@ -0,0 +1,50 @@
+#  Copyright (C) 2021.
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Thin wrapper around orjson. Falls back to simplejson if orjson is missing.
+Both functions work on bytes.
+"""
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    import simplejson
+
+
+def loads(data: bytes):
+    """
+    Parse the given JSON document.
+    :param data: JSON document as bytes.
+    :return: The parsed object.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return simplejson.loads(data)
+
+
+def dumps(data, indent: bool = False) -> bytes:
+    """
+    Serialize the given object. Non string keys are converted to strings.
+    :param data: The object to serialize.
+    :param indent: Indent the output with 2 spaces.
+    :return: The JSON document as bytes.
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option)
+    return simplejson.dumps(data, indent=2 if indent else None).encode()
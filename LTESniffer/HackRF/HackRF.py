@@ -15,14 +15,32 @@
 #
 
 import asyncio
-import logging
 import re
 import subprocess
 from pathlib import Path
-from decimal import Decimal
 from typing import Dict, Optional, List, Tuple
 
 from .Exceptions import HackRFError, ScanTimeOut
+from ..Log import logging
+
+# Pattern for the (undecoded) stdout lines of CellSearch. The name of the
+# matched alternative (lastgroup) tells the line type:
+# freq: Examining center frequency x, peak: Hit num peaks x
+# Everything else might be a cell info line (see check_found_cell).
+_RE_LINE = re.compile(
+    rb"(?P<freq>Examining center frequency (?P<freq_mhz>[\d.]+) MHz)"
+    rb"|(?P<peak>Hit\s+num peaks (?P<num_peaks>\d+))"
+)
+# Last column of a cell info line
+_RE_CRYSTAL_CORRECTION_FACTOR = re.compile(rb"[\d.]+")
+# Number of columns of a cell info line
+CELL_INFO_COLUMNS = 11
+# Prefixes of all lines, which carry information (frequency, peaks,
+# no cells found and the cell info lines, which start with the duplex mode)
+DATA_LINE_PREFIXES = (b"Examining", b"Hit", b"No LTE", b"FDD", b"TDD")
+
+# Buffer size of the stdout reader of CellSearch (default of asyncio: 64KiB)
+STDOUT_BUFFER_LIMIT = 1 << 20
 
 
 class HackRF:
@@ -33,6 +51,10 @@ class HackRF:
     # Only print the output of hackrf_info once
     PRINTED_HACKRF_INFO = False
 
+    # Results of successful probes (see invalidate_probe)
+    _CONNECTED_OK = False
+    _CELL_SEARCH_OK = False
+
     def __init__(self, amp_enable: bool, antenna_enable: bool,
                  l_gain: int, g_gain: int, sample_rate: int,
                  recording_time: float, baseband_filter_bw: int):
@@ -63,6 +85,9 @@ class HackRF:
         :returns: True if no exception has been raised.
         :raises HackRFError: hackRF not connected or libhackrf missing
         """
+        # only run hackrf_info again after an error
+        if HackRF._CONNECTED_OK:
+            return True
         try:
             subprocess.run("hackrf_info",
                            capture_output=HackRF.PRINTED_HACKRF_INFO,
@@ -75,6 +100,7 @@ class HackRF:
         except subprocess.CalledProcessError:
             logging.critical("HackRF is offline and not connected!")
             raise HackRFError("Unable to find HackRF!")
+        HackRF._CONNECTED_OK = True
         return True
 
     @staticmethod
@@ -85,13 +111,42 @@ class HackRF:
         :returns: True if no exception has been raised.
         :raises HackRFError: CellSearch not available.
         """
+        if HackRF._CELL_SEARCH_OK:
+            return True
         try:
             subprocess.run("CellSearch", capture_output=True)
         except FileNotFoundError:
             msg = "Unable to locate CellSearch! Is LTE-Cell-Scanner installed?"
             raise HackRFError(msg)
+        HackRF._CELL_SEARCH_OK = True
         return True
 
+    @classmethod
+    def invalidate_probe(cls):
+        """
+        Forget the results of is_connected and cell_search_available.
+        The next call checks the hackRF and CellSearch again.
+        """
+        cls._CONNECTED_OK = False
+        cls._CELL_SEARCH_OK = False
+
+    @staticmethod
+    async def ensure_available(cell_search: bool = False):
+        """
+        Run is_connected (and cell_search_available) without blocking the
+        event loop. Returns immediately if earlier probes were successful.
+
+        :param cell_search: Also check CellSearch.
+        :raises HackRFError: hackRF or CellSearch not available.
+        """
+        if HackRF._CONNECTED_OK and (HackRF._CELL_SEARCH_OK
+                                     or not cell_search):
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, HackRF.is_connected)
+        if cell_search:
+            await loop.run_in_executor(None, HackRF.cell_search_available)
+
     @staticmethod
     async def cell_search(start_frequency: float,
                           end_frequency: float,
@@ -108,12 +163,14 @@ class HackRF:
         :raises ScanTimeOut: If the scan gets stuck.
         """
         # make sure that a hackRF is available
-        HackRF.is_connected()
-        HackRF.cell_search_available()
+        await HackRF.ensure_available(cell_search=True)
 
         peaks = {}
         found_cells = []
         cur_frequency = 0
+        # only used for the progress logs
+        start_frequency_mhz = start_frequency / 1e6
+        end_frequency_mhz = end_frequency / 1e6
 
         # Cell search params
         parameters = (
@@ -127,46 +184,56 @@ class HackRF:
             "CellSearch",
             *parameters,
             stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.STDOUT
+            stderr=asyncio.subprocess.STDOUT,
+            limit=STDOUT_BUFFER_LIMIT
         )
 
         # Check the stdout output of CellSearch.
+        lines = proc.stdout.__aiter__()
         while True:
             # retrieve a new line
             try:
                 # timeout after 30s
-                line = await asyncio.wait_for(proc.stdout.readline(), 30)
+                line = await asyncio.wait_for(lines.__anext__(), 30)
             except asyncio.TimeoutError:
                 # CellSearch might get stuck after a certain time
                 proc.kill()
+                await proc.wait()
+                HackRF.invalidate_probe()
                 raise ScanTimeOut
-
-            if not line:  # EOF - return result
+            except StopAsyncIteration:  # EOF - return result
+                # reap CellSearch before the event loop is closed
+                await proc.wait()
                 return peaks, found_cells
 
-            # we have a new line - process it
-            line = line.decode()
-
-            # Frequency
-            tmp_cur_frequency = check_cur_frequency(start_frequency,
-                                                    end_frequency, line)
-            if tmp_cur_frequency:
-                cur_frequency = tmp_cur_frequency
-
-            # Peak
-            peak = check_peak(line)
-            if peak > 0:
-                peaks[cur_frequency] = peak
-
-            # Found Cell
-            cell_dict = check_found_cell(start_frequency, end_frequency, line)
-            if cell_dict:  # found a cell
-                found_cells.append(cell_dict)
-
             if proc.returncode is not None and proc.returncode != 0:
+                HackRF.invalidate_probe()
                 raise HackRFError("Unknown Cell Search Error! Check stderr!")
 
-    def cell_recording(self, frequency_center: float, path: Path):
+            # skip the status output of CellSearch without any regex
+            if not line.startswith(DATA_LINE_PREFIXES):
+                continue
+
+            # we have a new line - process it
+            # one match per line - dispatch on the type of the line.
+            # The line stays bytes, only extracted fields are decoded.
+            match = _RE_LINE.match(line)
+            line_type = match.lastgroup if match else None
+
+            if line_type == "freq":  # Frequency
+                cur_frequency = check_cur_frequency(start_frequency_mhz,
+                                                    end_frequency_mhz, match)
+            elif line_type == "peak":  # Peak
+                peak = check_peak(match)
+                if peak > 0:
+                    peaks[cur_frequency] = peak
+            else:  # Found Cell
+                cell_dict = check_found_cell(start_frequency, end_frequency,
+                                             line)
+                if cell_dict:  # found a cell
+                    found_cells.append(cell_dict)
+
+    async def cell_recording(self, frequency_center: float, path: Path):
         """
         Record raw data based on the defined member values of hackRF and
         the given frequency.
@@ -175,9 +242,10 @@ class HackRF:
         :param path: Path where the recording should be saved.
 
         :raises HackRFError: If the recording fails.
+        :raises subprocess.CalledProcessError: hackrf_transfer failed.
         """
         # make sure that a hackRF is available
-        HackRF.is_connected()
+        await HackRF.ensure_available()
 
         n_samples = int(self.sample_rate * self.recording_time)
         logging.info(f"Starting data recording for {frequency_center / 1e6} "
@@ -188,8 +256,7 @@ class HackRF:
 
         # Cell search params
         parameters = (
-            "hackrf_transfer",
-            "-r", path,  # receive mode, save to given path
+            "-r", str(path),  # receive mode, save to given path
             "-f", str(int(frequency_center)),  # frequency
             "-a", str(int(self.amp_enable)),  # amp
             "-p", str(int(self.antenna_enable)),  # antenna port power,
@@ -200,130 +267,133 @@ class HackRF:
             "-b", str(self.baseband_filter_bw)
         )
 
+        # Start the recording in an async operation
+        proc = await asyncio.create_subprocess_exec(
+            "hackrf_transfer",
+            *parameters,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
         try:
-            process = subprocess.run(parameters,
-                                     capture_output=False, check=True,
-                                     timeout=self.recording_time + 30)
-        except TimeoutError:
+            _, stderr = await asyncio.wait_for(proc.communicate(),
+                                               self.recording_time + 30)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            HackRF.invalidate_probe()
             raise HackRFError("Recording of data failed for "
                               f"{frequency_center / 1e6} MHz! "
                               "Process should have ended 30s ago!")
-        if process.returncode == 0:
+        except BaseException:
+            # e.g. cancelled - do not leave hackrf_transfer holding the device
+            if proc.returncode is None:
+                proc.kill()
+            await proc.wait()
+            raise
+        if proc.returncode == 0:
             logging.info("Successfully recorded data for "
                          f"{frequency_center / 1e6} MHz! Saved to {path}")
         else:
-            raise HackRFError("Recording of data failed for "
-                              f" {frequency_center / 1e6} MHz!")
+            HackRF.invalidate_probe()
+            logging.error("hackrf_transfer failed: %s",
+                          stderr.decode(errors="replace").strip())
+            raise subprocess.CalledProcessError(
+                proc.returncode, ("hackrf_transfer", *parameters),
+                stderr=stderr)
 
 
-def check_peak(line: str) -> int:
+def check_peak(match: re.Match) -> int:
     """
-    Check for a peak line. Extract the number of detected peaks.
+    Process a peak line. Extract the number of detected peaks.
 
-    :param line: current line
+    :param match: Match of a peak line.
 
     :returns: detected peaks
     """
-    num_peaks = 0
-    re_found_peak = re.compile(r"Hit\s+num peaks (\d+)")
-    match_found_peak = re.match(re_found_peak, line)
-    if match_found_peak:
-        num_peaks = int(match_found_peak.group(1))
-        logging.debug(
-            f"Found {num_peaks} peaks!"
-        )
+    num_peaks = int(match.group("num_peaks"))
+    logging.debug("Found %d peaks!", num_peaks)
     return num_peaks
 
 
-def check_cur_frequency(start_frequency: float, end_frequency: float,
-                        line: str) -> Optional[float]:
+def check_cur_frequency(start_frequency_mhz: float, end_frequency_mhz: float,
+                        match: re.Match) -> int:
     """
-    Check for examining frequency x line.
+    Process an examining frequency x line.
     Extract the frequency.
 
-    :param start_frequency: start frequency of the scan
-    :param end_frequency: end frequency of the scan
-    :param line: current line
+    :param start_frequency_mhz: start frequency of the scan in MHz
+    :param end_frequency_mhz: end frequency of the scan in MHz
+    :param match: Match of an examining frequency line.
 
-    :returns: detected peaks
+    :returns: current frequency in Hz
     """
-    re_cur_freq = re.compile(r"^Examining center frequency ([\d.]+) MHz")
-    start_frequency_mhz = start_frequency / 1e6
-    end_frequency_mhz = end_frequency / 1e6
-
     # Status update
-    match_cur_freq = re.match(re_cur_freq, line)
-    if match_cur_freq:
-        # extract frequency
-        cur_freq = float(match_cur_freq.group(1))
+    # extract frequency
+    cur_freq = float(match.group("freq_mhz"))
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
         # calculate progress
         try:
-            progress = ((cur_freq * 1e6 - start_frequency)
-                        / (end_frequency - start_frequency)
+            progress = ((cur_freq - start_frequency_mhz)
+                        / (end_frequency_mhz - start_frequency_mhz)
                         * 100)
         except ZeroDivisionError:
             progress = 100
 
         # log the progress event
         logging.debug(
-            f"Current scan ({start_frequency_mhz} MHz to {end_frequency_mhz} "
-            f"MHz) cur: {cur_freq} MHz, progress: {int(progress)}%"
+            "Current scan (%s MHz to %s MHz) cur: %s MHz, progress: %d%%",
+            start_frequency_mhz, end_frequency_mhz, cur_freq, progress
         )
-        return int(cur_freq * 1e6)
+    return int(cur_freq * 1e6)
 
 
 def check_found_cell(start_frequency: float, end_frequency: float,
-                     line: str) -> Optional[Dict]:
+                     line: bytes) -> Optional[Dict]:
     """
-    Process the given string and try to extract information from it.
+    Process a cell search result line and extract the cell information.
 
     :param start_frequency: Start of the scanning area in Hz.
     :param end_frequency: End of the scanning area in Hz.
     :param line: The current stdout line from CellSearch.
     :return: Optional dict containing info about a found cell.
     """
-    if len(line) < 3:  # prevent useless regex checks...
+    # No cells found
+    if line.startswith(b"No LTE cells were found"):
+        logging.info("Cell Search Result (%s MHz to %s MHz): "
+                     "No LTE cells found!",
+                     start_frequency / 1e6, end_frequency / 1e6)
         return None
 
-    prefix = (f"Cell Search Result ({start_frequency / 1e6} MHz to "
-              f"{end_frequency / 1e6} MHz): ")
-
-    re_no_cells_found = re.compile(r"^No LTE cells were found")
-    # is there a better way to do this?
-    re_extract_cell_info = re.compile(
-        r"([^\s]+)\s+([^\s]+)\s+([^\s]+)\s+([^\s]+)\s+([^\s]+)\s+"
-        r"([^\s]+)\s+([^\s]+)\s+([^\s]+)\s+([^\s]+)\s+([^\s]+)\s+"
-        r"([\d.]+)"
-    )
-
-    # No cells found
-    match_no_cells_found = re.match(re_no_cells_found, line)
-    if match_no_cells_found:
-        logging.info(prefix + "No LTE cells found!")
+    # A cell info line starts with the duplex mode and has 11 columns.
+    # The last column has to be numeric.
+    if line[:1].isspace():
+        return None
+    fields = line.split()
+    if len(fields) < CELL_INFO_COLUMNS:
+        return None
+    crystal_correction_factor = _RE_CRYSTAL_CORRECTION_FACTOR.match(
+        fields[10])
+    if not crystal_correction_factor:
         return None
 
     # Extract cell info
-    match_extract_cell_info = re.match(re_extract_cell_info, line)
-    if match_extract_cell_info:
-        cell_info = {
-            "dpx": match_extract_cell_info.group(1),
-            "cell_id": int(match_extract_cell_info.group(2)),
-            "antenna_port": match_extract_cell_info.group(3),
-            "frequency_center": (int(float(match_extract_cell_info.group(4)
-                                           .strip("M")) * 1e6)),
-            "frequency_offset": (int(float(match_extract_cell_info.group(5)
-                                           .strip("k")) * 1e3)),
-            "rx_power": Decimal(match_extract_cell_info.group(6)),
-            "cp_type": match_extract_cell_info.group(7),
-            "nRB": int(match_extract_cell_info.group(8)),
-            "PHICH_duration": match_extract_cell_info.group(9),
-            "PHICH_resource_type": match_extract_cell_info.group(10),
-            "crystal_correction_factor": Decimal(
-                match_extract_cell_info.group(11)
-            )
-        }
-        logging.debug(f"Found a cell: {cell_info}")
-        return cell_info
+    cell_info = {
+        "dpx": fields[0].decode(),
+        "cell_id": int(fields[1]),
+        "antenna_port": fields[2].decode(),
+        "frequency_center": int(float(fields[3].strip(b"M")) * 1e6),
+        "frequency_offset": int(float(fields[4].strip(b"k")) * 1e3),
+        "rx_power": float(fields[5]),
+        "cp_type": fields[6].decode(),
+        "nRB": int(fields[7]),
+        "PHICH_duration": fields[8].decode(),
+        "PHICH_resource_type": fields[9].decode(),
+        "crystal_correction_factor": float(
+            crystal_correction_factor.group()
+        )
+    }
+    logging.debug("Found a cell: %s", cell_info)
+    return cell_info
 
 
 if __name__ == "__main__":
@@ -14,6 +14,7 @@
 #  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import os
 from pathlib import Path
 from typing import Optional
 
@@ -102,11 +103,10 @@ class LTESniffer:
         :param prefix: The absolute prefix.
         :return: The new absolute path.
         """
+        if os.path.isabs(path_str):
+            return Path(path_str)
         prefix: Path = self.path_base_dir if not prefix else prefix
-        path = Path(path_str)
-        if path.is_absolute():
-            return path
-        return prefix / path
+        return prefix / path_str
 
     def search(self, fast=False):
         """
@@ -121,3 +121,9 @@ class LTESniffer:
         Perform a data recording for all saved cells.
         """
         self.recording.record()
+
+    def close(self):
+        """
+        Release the resources of the modules.
+        """
+        self.cell_search.close()
@@ -0,0 +1,80 @@
+#  Copyright (C) 2021.
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Logging backend of the project. Uses picologging (the logging API implemented
+in C) if it is installed, otherwise the stdlib logging module.
+All modules have to log through this backend, since the handlers are only
+attached to its root logger.
+picologging has no SysLogHandler, the one of the stdlib is used with both
+backends. Records of stdlib loggers (asyncio, dynaconf, requests, ...) are
+forwarded to picologging by forward_stdlib_logging.
+"""
+import logging as stdlib_logging
+from logging.handlers import SysLogHandler
+
+# handlers used by LTESnifferRunner.configure_logging
+_REQUIRED_HANDLERS = ("RotatingFileHandler", "MemoryHandler",
+                      "QueueHandler", "QueueListener")
+
+try:
+    import picologging
+    import picologging.handlers
+    if not all(hasattr(picologging.handlers, handler)
+               for handler in _REQUIRED_HANDLERS):
+        raise ImportError("picologging lacks required handlers")
+    logging = picologging
+except ImportError:
+    import logging
+    import logging.handlers
+
+
+class _StdlibForwardingHandler(stdlib_logging.Handler):
+    """
+    Hands the records of stdlib loggers to the handlers of the picologging
+    root logger.
+    """
+
+    def emit(self, record):
+        """
+        Convert the record to a picologging record and handle it.
+        :param record: the stdlib log record.
+        """
+        record = logging.LogRecord(record.name, record.levelno,
+                                   record.pathname, record.lineno,
+                                   record.msg, record.args, record.exc_info,
+                                   record.funcName, record.stack_info)
+        for handler in logging.getLogger().handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+def forward_stdlib_logging(level):
+    """
+    Forward the records of stdlib loggers to the handlers of the root
+    logger of the backend. Does nothing if the backend is stdlib logging.
+    Call it after the handlers of the backend are set up.
+    :param level: minimal level of forwarded records.
+    """
+    if logging is stdlib_logging:
+        return
+    root = stdlib_logging.getLogger()
+    root.setLevel(level)
+    if not any(isinstance(handler, _StdlibForwardingHandler)
+               for handler in root.handlers):
+        root.addHandler(_StdlibForwardingHandler())
+
+
+__all__ = ["logging", "SysLogHandler", "forward_stdlib_logging"]
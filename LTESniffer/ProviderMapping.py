@@ -13,15 +13,32 @@
 #  You should have received a copy of the GNU General Public License
 #  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
-import json
-import logging
+import contextlib
+import os
+import tempfile
+from bisect import bisect_right
 from datetime import date
 from pathlib import Path
-from typing import Dict
+from typing import (Dict, Iterable, List, NamedTuple, Optional, Set,
+                    Tuple)
 
 import requests
 
+from . import FastJSON
 from .Structures.Cell import Cell
+from .Log import logging
+
+DOWNLOAD_CHUNK_SIZE = 1 << 16
+
+
+class Provider(NamedTuple):
+    """
+    The fields of an RTR assignment, which are copied onto a cell.
+    """
+    operator_id: int
+    company: str
+    band: str
+    region: str
 
 
 class ProviderMapping:
@@ -37,14 +54,30 @@ class ProviderMapping:
             coverage = ['national']
         self._url = url
         self._cache_path = cache
+        # filtered assignments of the last run (see save_filtered_assignments)
+        self._filtered_cache_path = Path(cache).with_suffix('.filtered.json')
+        self._etag: Optional[str] = None
+        self._reused_filtered: bool = False
 
         self.coverage = coverage
 
         self.loaded_data: bool = False
         self.data: Dict = {}
+        # frequency -> result of _resolve
+        self._provider_cache: Dict[int, Optional[Provider]] = {}
+        # assignments sorted by their lower frequency:
+        # (lower frequency, index in assignments, higher frequency, provider)
+        self._intervals: List[Tuple[int, int, int, Provider]] = []
+        self._interval_starts: List[int] = []
+        # running maximum of the higher frequencies of _intervals
+        self._interval_max_ends: List[int] = []
+        # indices (in assignments) of assignments overlapping with another one
+        self._overlapping: Set[int] = set()
 
         self.load_frequency_assignments()
-        self.remove_invalid_assignments()
+        if not self._reused_filtered:
+            self.remove_invalid_assignments()
+            self.save_filtered_assignments()
 
     @property
     def assignments(self):
@@ -53,28 +86,95 @@ class ProviderMapping:
     @assignments.setter
     def assignments(self, value):
         self.data['data'] = value
+        self._provider_cache.clear()
+        self._build_interval_index()
 
     @staticmethod
-    def download_frequency_assignments(url: str) -> Dict:
+    def _get_frequency_range(assignment: Dict) -> Tuple[int, int]:
         """
-        :param url:
+        :param assignment: RTR assignment.
+        :return: lower and higher (downlink) frequency of the assignment.
+        """
+        if assignment['duplex']:
+            return (assignment['downlinklowerfrequency'],
+                    assignment['downlinkhigherfrequency'])
+        return assignment['lowerfrequency'], assignment['higherfrequency']
+
+    def _build_interval_index(self):
+        """
+        Sort the assignments by their lower frequency, so that _resolve can
+        binary search them.
         :return:
         """
-        r = requests.get(url)
-        if r.status_code >= 300:
-            raise requests.RequestException
-        return r.json()
+        intervals = []
+        for i, assignment in enumerate(self.assignments):
+            start, end = self._get_frequency_range(assignment)
+            if start is None or end is None:
+                continue
+            provider = Provider(assignment['betreiberid'],
+                                assignment['company'],
+                                assignment['frequencyband'],
+                                assignment['coverage'])
+            intervals.append((start, i, end, provider))
+        intervals.sort(key=lambda x: (x[0], x[1]))
+        self._intervals = intervals
+        self._interval_starts = [x[0] for x in intervals]
+        self._interval_max_ends = []
+        max_end = None
+        # index of the interval reaching up to max_end
+        max_index = None
+        overlapping = set()
+        for start, index, end, _ in intervals:
+            # overlaps the earlier interval reaching the furthest. Any other
+            # earlier interval overlapping this one also overlaps an interval
+            # before it or the next one, so it is marked as well.
+            if max_end is not None and max_end >= start:
+                overlapping.add(index)
+                overlapping.add(max_index)
+            if max_end is None or end > max_end:
+                max_end, max_index = end, index
+            self._interval_max_ends.append(max_end)
+        self._overlapping = overlapping
 
     @staticmethod
-    def save_frequency_assignments(cache: Path, data: Dict):
+    def download_frequency_assignments(url: str, cache: Path,
+                                       etag: Optional[str] = None) \
+            -> Tuple[Optional[Dict], Optional[str]]:
         """
-
-        :param cache:
-        :param data:
-        :return:
+        Stream the assignments to a temporary file next to the cache and
+        replace the cache with it once the download could be parsed.
+        :param url:
+        :param cache: Path of the cache file.
+        :param etag: ETag of the cached assignments. If the assignments did
+                     not change, the cache is kept and no data is returned.
+        :return: The assignments (None if not modified) and their ETag.
         """
-        with open(cache, 'w') as fp:
-            json.dump(data, fp, indent=4)
+        cache = Path(cache)
+        headers = {'If-None-Match': etag} if etag else {}
+        fd, tmp_name = tempfile.mkstemp(dir=cache.parent,
+                                        prefix=cache.name, suffix='.tmp')
+        try:
+            # open fd first, so it is closed if the request fails
+            with os.fdopen(fd, 'wb') as fp, \
+                    requests.get(url, headers=headers, stream=True) as r:
+                if r.status_code == 304 and etag:
+                    os.remove(tmp_name)
+                    return None, etag
+                if r.status_code >= 300:
+                    raise requests.RequestException
+                for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    fp.write(chunk)
+                etag = r.headers.get('ETag')
+            try:
+                data = FastJSON.loads(Path(tmp_name).read_bytes())
+            except ValueError as e:
+                raise requests.RequestException from e
+            os.replace(tmp_name, cache)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_name)
+            raise
+        return data, etag
 
     @staticmethod
     def read_frequency_assignments(cache: Path) -> Dict:
@@ -83,15 +183,63 @@ class ProviderMapping:
         :param cache:
         :return:
         """
-        with open(cache, 'r') as fp:
-            return json.load(fp)
+        return FastJSON.loads(Path(cache).read_bytes())
+
+    def read_filtered_assignments(self) -> Optional[Dict]:
+        """
+        Read the filtered assignments of a previous run. They are only valid
+        for the same day, URL and coverage.
+        :return: The saved filtered assignments and their ETag or None.
+        """
+        try:
+            filtered = FastJSON.loads(self._filtered_cache_path.read_bytes())
+        except (FileNotFoundError, ValueError):
+            return None
+        if (not isinstance(filtered, dict)
+                or filtered.get('date') != date.today().isoformat()
+                or filtered.get('url') != self._url
+                or filtered.get('coverage') != list(self.coverage)
+                or not filtered.get('etag')):
+            return None
+        return filtered
+
+    def save_filtered_assignments(self):
+        """
+        Save the filtered assignments together with the ETag of the RTR
+        data, so that the next run can skip parsing and filtering if RTR
+        reports no changes.
+        :return:
+        """
+        if not self.loaded_data or not self._etag:
+            return
+        filtered = {
+            'date': date.today().isoformat(),
+            'url': self._url,
+            'coverage': list(self.coverage),
+            'etag': self._etag,
+            'data': self.assignments
+        }
+        try:
+            self._filtered_cache_path.write_bytes(FastJSON.dumps(filtered))
+        except OSError:
+            logging.exception('Failed to save the filtered assignments!')
 
     def load_frequency_assignments(self):
+        filtered = self.read_filtered_assignments()
         try:
-            self.data = self.download_frequency_assignments(self._url)
-            self.save_frequency_assignments(self._cache_path, self.data)
-            logging.debug('Successfully downloaded the most recent cell '
-                          'assignments from RTR!')
+            data, self._etag = self.download_frequency_assignments(
+                self._url, self._cache_path,
+                etag=filtered['etag'] if filtered else None)
+            if data is None:
+                # not modified - the filtered assignments are still valid
+                self.assignments = filtered['data']
+                self._reused_filtered = True
+                logging.debug('Cell assignments from RTR did not change! '
+                              'Reused the filtered assignments.')
+            else:
+                self.data = data
+                logging.debug('Successfully downloaded the most recent cell '
+                              'assignments from RTR!')
         except requests.RequestException:
             logging.error('Download of most recent RTR assignments has '
                           'failed!')
@@ -113,9 +261,9 @@ class ProviderMapping:
         :return:
         """
         new_assignments = []
+        today = date.today()
         for assignment in self.assignments:
             # check date
-            today = date.today()
             if assignment['startdate'] is not None:
                 start_date = date.fromisoformat(assignment['startdate'])
                 if today < start_date:
@@ -136,31 +284,80 @@ class ProviderMapping:
             new_assignments.append(assignment)
         self.assignments = new_assignments
 
+    def _resolve(self, frequency: int) -> Optional[Provider]:
+        """
+        Find the assignment of the given downlink frequency.
+        Results are cached per frequency.
+        :param frequency: Frequency in Hz.
+        :return: The provider or None if no assignment covers the frequency.
+        """
+        if frequency in self._provider_cache:
+            return self._provider_cache[frequency]
+
+        # candidates start at or below the frequency. Walk them downwards
+        # until no earlier assignment can reach up to the frequency.
+        matches = []
+        i = bisect_right(self._interval_starts, frequency) - 1
+        while i >= 0 and self._interval_max_ends[i] >= frequency:
+            _, index, end, candidate = self._intervals[i]
+            if frequency <= end:
+                matches.append((index, candidate))
+                # the only match, if it does not overlap with another one
+                if index not in self._overlapping:
+                    break
+            i -= 1
+        # keep the behaviour of the linear scan: last assignment wins
+        matches.sort(key=lambda x: x[0])
+
+        provider = None
+        for _, candidate in matches:
+            if provider:
+                logging.critical(
+                    f'Multiple assignments! Found provider '
+                    f'{candidate.operator_id} - {candidate.company} for '
+                    f' frequency {frequency} Hz in band {candidate.band} '
+                    f'(Region: {candidate.region})')
+            provider = candidate
+        self._provider_cache[frequency] = provider
+        return provider
+
+    @staticmethod
+    def _apply_provider(cell: Cell, provider: Provider):
+        """
+        Copy the provider onto the cell.
+        :param cell: The cell.
+        :param provider: The provider of the cell's frequency.
+        :return:
+        """
+        operator_id, company, band, region = provider
+        cell.operator_id = operator_id
+        cell.operator = company
+        cell.band = band
+        cell.region = region
+        logging.info(f'Found provider {operator_id} - {company} for '
+                     f' cell {cell} in band {band} '
+                     f'(Region: {region})')
+
     def find_provider(self, cell: Cell):
-        match = False
-        for assignment in self.assignments:
-            duplex = assignment['duplex']
-            operator_id = assignment['betreiberid']
-            company = assignment['company']
-            band = assignment['frequencyband']
-            start_frequency = (assignment['lowerfrequency']
-                               if not duplex
-                               else assignment['downlinklowerfrequency'])
-            higher_frequency = (assignment['higherfrequency']
-                                if not duplex
-                                else assignment['downlinkhigherfrequency'])
-            if start_frequency <= cell.frequency_center <= higher_frequency:
-                if match:
-                    logging.critical(
-                        f'Multiple assignments! Found provider '
-                        f'{operator_id} - {company} for '
-                        f' cell {cell} in band {band} '
-                        f'(Region: {assignment["coverage"]})')
-                cell.operator_id = operator_id
-                cell.operator = company
-                cell.band = band
-                cell.region = assignment['coverage']
-                match = True
-                logging.info(f'Found provider {operator_id} - {company} for '
-                             f' cell {cell} in band {band} '
-                             f'(Region: {assignment["coverage"]})')
+        provider = self._resolve(cell.frequency_center)
+        if provider is None:
+            return
+        self._apply_provider(cell, provider)
+
+    def find_providers(self, cells: Iterable[Cell]):
+        """
+        Find the providers of multiple cells. Every frequency is only looked
+        up once.
+        :param cells: The cells.
+        :return:
+        """
+        cells_by_frequency: Dict[int, List[Cell]] = {}
+        for cell in cells:
+            cells_by_frequency.setdefault(cell.frequency_center, []).append(
+                cell)
+        for frequency in sorted(cells_by_frequency):
+            provider = self._resolve(frequency)
+            if provider is None:
+                continue
+            for cell in cells_by_frequency[frequency]:
+                self._apply_provider(cell, provider)
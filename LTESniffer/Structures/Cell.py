@@ -21,6 +21,9 @@ class Cell:
     """
     Represents a LTE cell.
     """
+    __slots__ = ("scan_id", "cell_id", "frequency_center", "frequency_offset",
+                 "rx_power", "dpx", "operator_id", "operator", "band",
+                 "region", "recordings", "data")
 
     def __init__(self, scan_id: str, cell_id: int, frequency_center: int,
                  frequency_offset: int, dpx: str, rx_power: str,
@@ -71,18 +74,20 @@ class Cell:
 
     def dict(self) -> Dict:
         """
-        Get a dict for data backups.
+        Get a dict for data backups. The data of the cell is not modified.
         :return: Dict representing the object.
         """
-        self.data["scan_id"] = self.scan_id
-        self.data["cell_id"] = self.cell_id
-        self.data["frequency_center"] = self.frequency_center
-        self.data["frequency_offset"] = self.frequency_offset
-        self.data["rx_power"] = self.rx_power
-        self.data["dpx"] = self.dpx
-        self.data["recordings"] = self.recordings
-        self.data["operator_id"] = self.operator_id
-        self.data["operator"] = self.operator
-        self.data["band"] = self.band
-        self.data["region"] = self.region
-        return self.data
+        return {
+            **self.data,
+            "scan_id": self.scan_id,
+            "cell_id": self.cell_id,
+            "frequency_center": self.frequency_center,
+            "frequency_offset": self.frequency_offset,
+            "rx_power": self.rx_power,
+            "dpx": self.dpx,
+            "recordings": self.recordings,
+            "operator_id": self.operator_id,
+            "operator": self.operator,
+            "band": self.band,
+            "region": self.region
+        }
@@ -14,12 +14,15 @@
 #  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 from .Cell import Cell
 
 
 class FrequencyBand:
+    __slots__ = ("start_frequency", "end_frequency", "scanned_ids", "scan",
+                 "cells", "_cells_by_id")
+
     def __init__(self, start_frequency: int,
                  end_frequency: int, scanned_ids: List[str], scan=True):
         """
@@ -31,15 +34,34 @@ class FrequencyBand:
         """
         self.start_frequency = start_frequency
         self.end_frequency = end_frequency
+        # Kept as a list: it only holds a handful of scan IDs and its order
+        # is preserved in the scan config. (membership tests are cheap)
         self.scanned_ids = scanned_ids
         self.scan = scan
 
         self.cells: List[Cell] = []
+        self._cells_by_id: Dict[int, Cell] = {}
 
     def __str__(self):
         return (f"Band ({self.start_frequency / 1e6}MHz to "
                 f" {self.end_frequency / 1e6}MHz)")
 
+    def add_cell(self, cell: Cell):
+        """
+        Add a cell to the band.
+        :param cell: The new cell.
+        """
+        self.cells.append(cell)
+        self._cells_by_id[cell.cell_id] = cell
+
+    def get_cell(self, cell_id: int) -> Optional[Cell]:
+        """
+        Get a cell of this band by its ID.
+        :param cell_id: The ID of the cell.
+        :return: The cell or None if it is unknown.
+        """
+        return self._cells_by_id.get(cell_id)
+
     def dict(self) -> Dict:
         """
         Get a dict for data backups.
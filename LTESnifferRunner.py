@@ -17,20 +17,115 @@
 #
 
 import argparse
-import logging
-import logging.handlers
+import hashlib
 import os
+import queue
+import sys
+import tempfile
 from argparse import ArgumentParser
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
-from dynaconf import Dynaconf, Validator, validator
+from typing import TYPE_CHECKING, Final, Optional, Tuple
+
+from LTESniffer import FastJSON
+from LTESniffer.Log import SysLogHandler, forward_stdlib_logging, logging
+
+# dynaconf and LTESniffer are imported where they are needed, so that --help
+# does not pay for their imports.
+if TYPE_CHECKING:
+    from dynaconf import Dynaconf
+
+_log = logging.getLogger(__name__)
+
+# main project directory (directory of this file)
+_MODULE_DIR: Final[Path] = Path(__file__).resolve().parent
+
+# size of the log file before it is rotated
+LOG_FILE_MAX_BYTES = 50 * 1024 * 1024
+# number of records buffered before they are written to the log file
+LOG_FILE_BUFFER_RECORDS = 256
+# formatters of the console/file handlers and of the syslog handler
+_FORMATTER = logging.Formatter("%(asctime)s %(module)s.%(funcName)s: "
+                               "[%(levelname)s] %(message)s")
+_SYSLOG_FORMATTER = logging.Formatter("%(module)s.%(funcName)s: "
+                                      "[%(levelname)s] %(message)s")
+
+# valid sample rates and baseband filter bandwidths of hackRF in Hz
+_SAMPLE_RATES = frozenset((4e6, 8e6, 10e6, 12.5e6, 16e6, 19.2e6, 20e6))
+_BASEBAND_FILTER_BWS = frozenset((1.75e6, 2.5e6, 3.5e6, 5e6, 5.5e6, 6e6, 7e6,
+                                  8e6, 9e6, 10e6, 12e6, 14e6, 15e6, 20e6,
+                                  24e6, 28e6))
+
+# corrections of invalid record settings:
+# (key, name in the log, unit, check, default)
+_RECORD_CLAMPS = (
+    ("l_gain", "l_gain", "dB", lambda v: 0 <= v <= 40 and v % 8 == 0, 40),
+    ("g_gain", "g_gain", "dB", lambda v: 0 <= v <= 62 and v % 2 == 0, 40),
+    ("sample_rate", "sample_rate", "Hz", lambda v: v in _SAMPLE_RATES,
+     12.5e6),
+    ("recording_time", "recording time", "s", lambda v: v >= 0.1, 1),
+    ("baseband_filter_bw", "baseband_filter_bw", "Hz",
+     lambda v: v in _BASEBAND_FILTER_BWS, 20e6),
+)
+
+# validated settings: (settings path, mtime in ns, size) -> settings
+_SETTINGS_CACHE: "OrderedDict[Tuple[str, int, int], Dynaconf]" = OrderedDict()
+_SETTINGS_CACHE_SIZE = 16
+# settings making dynaconf load further files
+_SETTINGS_INCLUDE_KEYS = ("DYNACONF_INCLUDE", "INCLUDES_FOR_DYNACONF",
+                          "PRELOAD_FOR_DYNACONF", "SECRETS_FOR_DYNACONF")
+
+
+@lru_cache(maxsize=1)
+def _get_validators() -> tuple:
+    """
+    Build the validators of the settings (once).
+    :return: Tuple of dynaconf validators.
+    """
+    from dynaconf import Validator
 
-from LTESniffer.LTESniffer import LTESniffer
+    return (
+        # general
+        Validator("general.scan_id", "general.base_dir", is_type_of=str,
+                  must_exist=True),
 
+        Validator("general.regions", must_exist=True),
 
-def read_arguments() -> argparse.Namespace:
+        # search
+        Validator("search.enable", "search.rescan", is_type_of=bool,
+                  must_exist=True),
+
+        Validator("search.scan_config", "search.results_dir",
+                  is_type_of=str, must_exist=True),
+
+        Validator("search.step_width",
+                  is_type_of=int, must_exist=True, lte=10, gte=1),
+
+        # record
+        Validator("record.results_dir", is_type_of=str,
+                  must_exist=True),
+
+        Validator("record.amp_enable", "record.antenna_enable",
+                  "record.enable", is_type_of=bool, must_exist=True),
+
+        Validator("record.l_gain", "record.g_gain",
+                  is_type_of=int, must_exist=True),
+
+        Validator("record.sample_rate", "record.recording_time",
+                  "record.baseband_filter_bw", is_type_of=float,
+                  must_exist=True),
+
+        # matlab
+        Validator("matlab.enable", is_type_of=bool, must_exist=True),
+    )
+
+
+@lru_cache(maxsize=1)
+def _build_parser() -> ArgumentParser:
     """
-    Configures the possible arguments and reads them from argv.
-    :return: namespace containing the parsed arguments
+    Configures the possible arguments. The parser is only built once.
+    :return: the argument parser
     """
     parser = ArgumentParser(
         description=("Simple tool for automation of LTE/4G cell searches and "
@@ -80,12 +175,45 @@ def read_arguments() -> argparse.Namespace:
                                help=("Enable logging to syslog. "
                                      "(Default: False)"))
 
-    return parser.parse_args()
+    return parser
+
+
+def read_arguments() -> argparse.Namespace:
+    """
+    Reads the arguments from argv.
+    :return: namespace containing the parsed arguments
+    """
+    return _build_parser().parse_args()
+
+
+class _LazySysLogHandler(SysLogHandler):
+    """
+    SysLogHandler which connects to syslog on the first emitted record
+    instead of on creation. emit() creates the socket if there is none.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """
+        Create the handler without connecting to syslog.
+        Same parameters as SysLogHandler.
+        """
+        self._skip_connect = True
+        super().__init__(*args, **kwargs)
+
+    def createSocket(self):
+        """
+        Skip the connection during the initialisation. Afterwards (called
+        by emit() while holding the handler lock) connect as usual.
+        """
+        if self._skip_connect:
+            self._skip_connect = False
+            return
+        super().createSocket()
 
 
 def configure_logging(log_level: str, log_dir: str, enable_stdout: bool = True,
                       enable_file: bool = True, enable_syslog: bool = False) \
-        -> logging:
+        -> Tuple[logging.Logger, Optional[logging.handlers.QueueListener]]:
     """
     Configure the logger
     :param log_level: loglevel as string (NOTSET, DEBUG, INFO, Warning, Error,
@@ -95,88 +223,213 @@ def configure_logging(log_level: str, log_dir: str, enable_stdout: bool = True,
     :param enable_file: Enable logging to the logging folder?
     :param enable_syslog: Enable logging to syslog?
 
-    :returns logging: object of class logging (root logger)
+    :returns: the root logger (picologging or stdlib) and the listener
+              writing to the log file and syslog in a background thread
+              (None if both are disabled). Stop the listener and flush its
+              handlers before exiting.
     """
     log_levels = {
-        'NOTSET': 0,
+        'NOTSET': logging.NOTSET,
         'DEBUG': logging.DEBUG,
         'INFO': logging.INFO,
         'WARNING': logging.WARNING,
         'ERROR': logging.ERROR,
         'CRITICAL': logging.CRITICAL
     }
-    level = log_levels[log_level.upper()
-                       if log_level.upper() in log_levels
-                       else logging.DEBUG]
+    level = log_levels.get(log_level.upper(), logging.DEBUG)
 
     # modify root logger
     log = logging.getLogger("")
 
-    form = logging.Formatter("%(asctime)s %(module)s.%(funcName)s: "
-                             "[%(levelname)s] %(message)s")
-
-    form_syslog = logging.Formatter("%(module)s.%(funcName)s: "
-                                    "[%(levelname)s] %(message)s")
-
     log_path = ""
     log.setLevel(level)
+    # file and syslog handlers - run by a QueueListener
+    queued_handlers = []
     if enable_file:
         file = "LTESnifferRepo.log"
         log_dir = Path(log_dir)
         if not log_dir.is_absolute():
-            log_dir = Path(__file__).parent.absolute() / log_dir
+            log_dir = _MODULE_DIR / log_dir
 
-        os.makedirs(log_dir, exist_ok=True)
+        log_dir.mkdir(parents=True, exist_ok=True)
 
-        log_path = Path(log_dir, file)
+        log_path = log_dir / file
 
-        fh = logging.handlers.TimedRotatingFileHandler(
+        fh = logging.handlers.RotatingFileHandler(
             log_path,
-            when="S", interval=86400,
+            maxBytes=LOG_FILE_MAX_BYTES,
             backupCount=100
         )
-        fh.doRollover()
         fh.setLevel(level)
-        fh.setFormatter(form)
-        log.addHandler(fh)
+        fh.setFormatter(_FORMATTER)
+        # write the records in batches. Errors are written immediately.
+        buffered_fh = logging.handlers.MemoryHandler(
+            capacity=LOG_FILE_BUFFER_RECORDS,
+            flushLevel=logging.ERROR,
+            target=fh
+        )
+        buffered_fh.setLevel(level)
+        queued_handlers.append(buffered_fh)
 
     if enable_stdout:
         sh = logging.StreamHandler()
         sh.setLevel(level)
-        sh.setFormatter(form)
+        sh.setFormatter(_FORMATTER)
         log.addHandler(sh)
 
     if enable_syslog:
         # unix only
-        sl = logging.handlers.SysLogHandler(address="/dev/log")
+        # connects on the first record, not on startup
+        sl = _LazySysLogHandler(address="/dev/log")
         sl.setLevel(level)
-        sl.setFormatter(form_syslog)
-        log.addHandler(sl)
+        sl.setFormatter(_SYSLOG_FORMATTER)
+        queued_handlers.append(sl)
+
+    # only enqueue the records in the logging thread. Disk and syslog I/O
+    # is done by the listener thread.
+    listener = None
+    if queued_handlers:
+        log_queue = queue.SimpleQueue()
+        log.addHandler(logging.handlers.QueueHandler(log_queue))
+        listener = logging.handlers.QueueListener(
+            log_queue, *queued_handlers, respect_handler_level=True)
+        listener.start()
+
+    # asyncio, dynaconf, requests, ... log with stdlib logging
+    forward_stdlib_logging(level)
 
     # log log_path
-    if enable_file:
-        logging.debug("Logging to %s", log_path)
+    if enable_file and _log.isEnabledFor(logging.DEBUG):
+        _log.debug("Logging to %s", log_path)
 
-    return log
+    return log, listener
 
 
-def setup_dynaconf(config_dir: str, settings_file: str) -> Dynaconf:
+def _get_file_key(path) -> Optional[Tuple[int, int]]:
     """
-    Setup dynaconf and validate the given config file.
-    :param config_dir: path to config dir
+    Get the modification time and size of the given file.
+    :param path: path of the file.
+    :return: (mtime_ns, size) or None if the file does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _find_dotenv() -> Optional[Path]:
+    """
+    Find the .env file loaded by dynaconf. Like dynaconf, search the
+    directory of the started script, the working directory and their parents
+    (each with its config sub directory).
+    :return: path of the .env file or None.
+    """
+    script_dir = Path(sys.argv[0]).resolve().parent
+    for start in (script_dir, Path.cwd()):
+        for folder in (start, *start.parents):
+            for dotenv in (folder / ".env", folder / "config" / ".env"):
+                if dotenv.is_file():
+                    return dotenv
+    return None
+
+
+def _get_settings_cache_path(config_folder: Path, settings_file: str,
+                             stat: os.stat_result) -> Path:
+    """
+    Get the path of the persistent cache of the given settings file.
+    The name depends on the files read by dynaconf (the settings file, its
+    .local file and the .env file) and the environment variables. The
+    validators are part of the key too (this file and
+    dynaconf_validators.toml), so a hit means the same input was already
+    validated successfully.
+    :param config_folder: path to the config dir
     :param settings_file: Name of the config file.
-    :return:
+    :param stat: stat of the settings file.
+    :return: path of the cache file.
     """
-    # path hardcoded - bad
-    # determine path
-    config_folder = Path(__file__).parent.absolute() / Path(config_dir)
-    settings_path = Path(config_folder, settings_file)
-    if not settings_path.exists():
-        logging.critical("The defined custom config file %s does not exist!",
-                         settings_path)
-        exit(1)
+    settings_path = Path(settings_file)
+    local_file = f"{settings_path.stem}.local{settings_path.suffix}"
+    key = [settings_file, stat.st_mtime_ns, stat.st_size,
+           _get_file_key(__file__),
+           _get_file_key(config_folder / local_file),
+           _get_file_key(config_folder / "dynaconf_validators.toml")]
+    dotenv = _find_dotenv()
+    if dotenv:
+        key += [str(dotenv), _get_file_key(dotenv)]
+    key += sorted((name, value) for name, value in os.environ.items()
+                  if name.startswith("LTESNIFFER_")
+                  or name.endswith("_FOR_DYNACONF"))
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+    return config_folder / f".{settings_file}.{digest}.json"
+
+
+def _load_settings_cache(cache_path: Path) -> Optional["Dynaconf"]:
+    """
+    Load validated settings from the persistent cache.
+    :param cache_path: path of the cache file.
+    :return: the settings or None if there is no usable cache.
+    """
+    from dynaconf import Dynaconf
 
+    try:
+        data = FastJSON.loads(cache_path.read_bytes())
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        _log.warning("Ignoring broken settings cache %s: %s", cache_path, e)
+        return None
+    # the values are already merged and validated, no files are loaded
+    settings = Dynaconf(envvar_prefix="LTESNIFFER", load_dotenv=False)
+    settings.update(data)
+    return settings
+
+
+def _save_settings_cache(cache_path: Path, settings_file: str,
+                         settings: "Dynaconf"):
+    """
+    Save validated settings to the persistent cache and remove the caches
+    of older versions of the settings file. Settings including other files
+    are not cached, since these files are not part of the cache key.
+    :param cache_path: path of the cache file.
+    :param settings_file: Name of the config file.
+    :param settings: the validated settings.
+    """
+    if any(settings.get(key) for key in _SETTINGS_INCLUDE_KEYS):
+        return
+    try:
+        fd, tmp_name = tempfile.mkstemp(dir=cache_path.parent,
+                                        prefix=cache_path.name,
+                                        suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(FastJSON.dumps(settings.as_dict(), indent=True))
+            os.replace(tmp_name, cache_path)
+        except BaseException:
+            os.remove(tmp_name)
+            raise
+        for old_cache in cache_path.parent.glob(f".{settings_file}.*.json"):
+            if old_cache != cache_path:
+                old_cache.unlink()
+    except OSError as e:
+        _log.warning("Unable to save the settings cache %s: %s",
+                     cache_path, e)
+
+
+def _build_settings(config_folder: Path, settings_file: str) -> "Dynaconf":
+    """
+    Load the given config file with dynaconf and validate it.
+    :param config_folder: path to the config dir
+    :param settings_file: Name of the config file.
+    :return: the validated settings
+    """
     # dynaconf
+    from dynaconf import Dynaconf, validator
+
+    # load_dotenv has to stay enabled: dynaconf searches the .env file from
+    # the working directory upwards (dotenv_path is not used for that search),
+    # so the config folder cannot tell whether one exists. Repeated loads are
+    # served by the settings caches anyway.
     settings = Dynaconf(
         envvar_prefix="LTESNIFFER",
         settings_file=settings_file,
@@ -189,80 +442,75 @@ def setup_dynaconf(config_dir: str, settings_file: str) -> Dynaconf:
     )
 
     # validate
-    settings.validators.register(
-        # general
-        Validator("general.scan_id", "general.base_dir", is_type_of=str,
-                  must_exist=True),
-
-        Validator("general.regions", must_exist=True),
-
-        # search
-        Validator("search.enable", "search.rescan", is_type_of=bool,
-                  must_exist=True),
-
-        Validator("search.scan_config", "search.results_dir",
-                  is_type_of=str, must_exist=True),
-
-        Validator("search.step_width",
-                  is_type_of=int, must_exist=True, lte=10, gte=1),
-
-        # record
-        Validator("record.results_dir", is_type_of=str,
-                  must_exist=True),
-
-        Validator("record.amp_enable", "record.antenna_enable",
-                  "record.enable", is_type_of=bool, must_exist=True),
-
-        Validator("record.l_gain", "record.g_gain",
-                  is_type_of=int, must_exist=True),
-
-        Validator("record.sample_rate", "record.recording_time",
-                  "record.baseband_filter_bw", is_type_of=float,
-                  must_exist=True),
-
-        # matlab
-        Validator("matlab.enable", is_type_of=bool, must_exist=True)
-    )
+    settings.validators.register(*_get_validators())
 
     # correct incorrect values
     try:
         settings.validators.validate()
     except validator.ValidationError as e:
-        logging.exception(e)
+        _log.exception(e)
         exit(1)
 
-    if (settings.record.l_gain < 0 or settings.record.l_gain > 40
-            or settings.record.l_gain % 8 != 0):
-        logging.warning("Invalid value for l_gain: %sdB! Setting to %sdB",
-                        settings.record.l_gain, 40)
-        settings.record.l_gain = 40
-
-    if (settings.record.g_gain < 0 or settings.record.g_gain > 62
-            or settings.record.g_gain % 2 != 0):
-        logging.warning("Invalid value for g_gain: %sdB! Setting to %sdB",
-                        settings.record.g_gain, 40)
-        settings.record.g_gain = 40
-
-    if settings.record.sample_rate not in (4e6, 8e6, 10e6, 12.5e6, 16e6,
-                                           19.2e6, 20e6):
-        logging.warning("Invalid value for sample_rate: %sHz! Setting to %sHz",
-                        settings.record.sample_rate, 12.5e6)
-        settings.record.sample_rate = 12.5e6
-
-    if settings.record.recording_time < 0.1:
-        logging.warning("Invalid value for recording time: %ss! Setting to "
-                        "%ss",
-                        settings.record.recording_time, 1)
-        settings.record.recording_time = 1
-
-    if (settings.record.baseband_filter_bw
-            not in (1.75e6, 2.5e6, 3.5e6, 5e6, 5.5e6, 6e6, 7e6, 8e6, 9e6,
-                    10e6, 12e6, 14e6, 15e6, 20e6, 24e6, 28e6)):
-        logging.warning("Invalid value for baseband_filter_bw: %sHz! "
-                        "Setting to %sHz",
-                        settings.record.baseband_filter_bw, 20e6)
-        settings.record.baseband_filter_bw = 20e6
+    return settings
+
 
+def _correct_settings(settings):
+    """
+    Set invalid record values to their defaults. This is done on every run
+    (not cached), so the warnings are logged each time.
+    :param settings: the validated settings.
+    """
+    for key, name, unit, is_valid, default in _RECORD_CLAMPS:
+        value = settings.record[key]
+        if not is_valid(value):
+            _log.warning("Invalid value for %s: %s%s! Setting to %s%s",
+                         name, value, unit, default, unit)
+            settings.record[key] = default
+
+
+def setup_dynaconf(config_dir: str, settings_file: str,
+                   use_cache: bool = True) -> "Dynaconf":
+    """
+    Setup dynaconf and validate the given config file.
+    :param config_dir: path to config dir
+    :param settings_file: Name of the config file.
+    :param use_cache: Reuse and store the settings of earlier runs. If
+                      False, the config is always loaded and validated and
+                      nothing is written to disk.
+    :return: the validated settings
+    """
+    # path hardcoded - bad
+    # determine path
+    config_folder = _MODULE_DIR / config_dir
+    settings_path = Path(config_folder, settings_file)
+    if not settings_path.exists():
+        _log.critical("The defined custom config file %s does not exist!",
+                      settings_path)
+        exit(1)
+
+    if not use_cache:
+        settings = _build_settings(config_folder, settings_file)
+        _correct_settings(settings)
+        return settings
+
+    # reuse the settings if the file did not change
+    stat = settings_path.stat()
+    cache_key = (str(settings_path), stat.st_mtime_ns, stat.st_size)
+    if cache_key in _SETTINGS_CACHE:
+        _SETTINGS_CACHE.move_to_end(cache_key)
+        return _SETTINGS_CACHE[cache_key]
+
+    # reuse the settings of an earlier run
+    cache_path = _get_settings_cache_path(config_folder, settings_file, stat)
+    settings = _load_settings_cache(cache_path)
+    if settings is None:
+        settings = _build_settings(config_folder, settings_file)
+        _save_settings_cache(cache_path, settings_file, settings)
+    _correct_settings(settings)
+
+    _SETTINGS_CACHE[cache_key] = settings
+    if len(_SETTINGS_CACHE) > _SETTINGS_CACHE_SIZE:
+        _SETTINGS_CACHE.popitem(last=False)
     return settings
 
 
@@ -277,22 +525,43 @@ def main():
     # setup config
     args = read_arguments()
 
-    configure_logging(args.LOGLEVEL, log_dir, args.ENABLE_STDOUT,
-                      args.ENABLE_FILE, args.ENABLE_SYSLOG)
-
-    settings = setup_dynaconf(config_dir, args.CONFIG_FILE)
     if args.VALIDATE_CONFIG:
+        # only log to stdout, no log files are needed for the validation
+        logging.basicConfig(level=args.LOGLEVEL.upper(), stream=sys.stdout)
+        forward_stdlib_logging(args.LOGLEVEL.upper())
+        try:
+            setup_dynaconf(config_dir, args.CONFIG_FILE, use_cache=False)
+        except SystemExit:
+            print("FAIL")
+            raise
+        print("OK")
         return 0
 
-    # ToDO much more :p
+    _, listener = configure_logging(args.LOGLEVEL, log_dir,
+                                    args.ENABLE_STDOUT, args.ENABLE_FILE,
+                                    args.ENABLE_SYSLOG)
     try:
-        sniffer = LTESniffer(settings=settings,
-                             project_dir=Path(__file__).parent.absolute())
-        sniffer.search(fast=args.FAST_SCAN)
-        sniffer.record()
-    except Exception as e:
-        logging.exception(e)
-        exit(1)
+        settings = setup_dynaconf(config_dir, args.CONFIG_FILE)
+
+        from LTESniffer.LTESniffer import LTESniffer
+
+        # ToDO much more :p
+        try:
+            sniffer = LTESniffer(settings=settings, project_dir=_MODULE_DIR)
+            try:
+                sniffer.search(fast=args.FAST_SCAN)
+                sniffer.record()
+            finally:
+                sniffer.close()
+        except Exception as e:
+            _log.exception(e)
+            exit(1)
+    finally:
+        # flush the queued and buffered records
+        if listener is not None:
+            listener.stop()
+            for handler in listener.handlers:
+                handler.flush()
 
 
 if __name__ == "__main__":